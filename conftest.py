@@ -0,0 +1,8 @@
+"""Shared pytest configuration for the dexcom_readings test suite."""
+import os
+import sys
+
+# Under --import-mode=importlib the test module's directory is no
+# longer prepended to sys.path automatically; keep dexcom_readings
+# importable regardless of the directory pytest is invoked from.
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
@@ -12,13 +12,20 @@ License:
     Copyright 2026. All rights reserved.
 """
 
+import atexit
+import collections
 import csv
 import datetime
+import json
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from logging.handlers import SysLogHandler, WatchedFileHandler
 import os
+import queue
+import random
 import signal
 import sys
+import threading
 import time
 import fcntl
 from pathlib import Path
@@ -27,6 +34,23 @@ from typing import Any, Optional
 from pydexcom import Dexcom  # Dexcom Share API client
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# orjson serializes small dicts ~5-10x faster than the stdlib encoder;
+# fall back to json so the dependency stays optional
+try:
+    import orjson
+
+    def _json_dumps(obj: Any) -> bytes:
+        return orjson.dumps(obj)
+except ImportError:
+    def _json_dumps(obj: Any) -> bytes:
+        return json.dumps(obj).encode("utf-8")
+
+# Cached at import to avoid repeated attribute lookups on the hot path;
+# also used with datetime.now() since datetime.utcnow() is deprecated
+_UTC = datetime.timezone.utc
 
 # IMPORTANT: Store your credentials securely as environment variables
 DEXCOM_USERNAME = os.environ.get("DEXCOM_USERNAME")
@@ -35,13 +59,32 @@ DEXCOM_PASSWORD = os.environ.get("DEXCOM_PASSWORD")
 # Japan. Default is "us".
 DEXCOM_REGION = os.environ.get("DEXCOM_REGION", "us")
 
+# Normalized once at import. The raw value may be unset, so repeated
+# .lower() calls at init time were both wasted work and a latent crash
+# on None.
+_REGION = (DEXCOM_REGION or "us").lower()
+
 NIGHTSCOUT_URL = os.environ.get("NIGHTSCOUT_URL")
 # Use a hashed secret if possible, but plain is common for API uploads
 NIGHTSCOUT_API_SECRET = os.environ.get("NIGHTSCOUT_API_SECRET")
 
+# Precomputed once at import so the f-string and rstrip do not run on
+# every upload; also validates the URL scheme up front so a bad config
+# fails fast instead of once a minute.
+_NS_ENDPOINT = None
+if NIGHTSCOUT_URL:
+    if NIGHTSCOUT_URL.lower().startswith(("http://", "https://")):
+        _NS_ENDPOINT = f"{NIGHTSCOUT_URL.rstrip('/')}/api/v1/entries"
+    else:
+        logging.error(
+            "NIGHTSCOUT_URL must start with http:// or https://, got %r. "
+            "Nightscout upload disabled.", NIGHTSCOUT_URL
+        )
+
 # Polling interval in seconds (configurable via environment variable)
 try:
-    POLLING_INTERVAL_SECONDS = int(
+    # Stored as a float so sleep/wait calls never re-coerce it
+    POLLING_INTERVAL_SECONDS = float(
         os.environ.get("POLLING_INTERVAL_SECONDS", "60")
     )
     if POLLING_INTERVAL_SECONDS < 1:
@@ -60,6 +103,41 @@ RETRY_MAX_ATTEMPTS = 3
 RETRY_INITIAL_DELAY_SECONDS = 1
 RETRY_MAX_DELAY_SECONDS = 30
 
+# Explicit HTTP timeout bounds so a hung remote host can never stall
+# the polling loop indefinitely
+NS_CONNECT_TIMEOUT_SECONDS = 3.0
+NS_READ_TIMEOUT_SECONDS = 7.0
+DEXCOM_FETCH_TIMEOUT_SECONDS = 10
+
+# CSV write batching. Rows are buffered in memory and written together,
+# letting the kernel coalesce disk writes; the telemetry is durability-
+# insensitive so a small window of loss is an acceptable trade.
+CSV_BATCH_SIZE = 10
+CSV_FLUSH_INTERVAL_SECONDS = 300
+
+# How often to log a heartbeat row when no new readings are arriving,
+# preserving a liveness signal in the CSV without a row per poll
+HEARTBEAT_INTERVAL_SECONDS = 3600
+
+# Adaptive polling: Dexcom CGMs emit a reading every ~300 seconds, so
+# wakeups are aligned to the expected next reading rather than polling
+# on a fixed short cadence that wastes 4 of 5 round-trips.
+READING_CADENCE_SECONDS = 300
+READING_CADENCE_MARGIN_SECONDS = 5
+LATE_READING_RETRY_SECONDS = 30
+LATE_READING_RETRY_MAX_SECONDS = 60
+POLL_JITTER_SECONDS = 5
+MIN_SLEEP_SECONDS = 5
+
+# Window for the per-poll fetch; wide enough to still catch a reading
+# that arrived a little late without re-downloading older history
+LATEST_READING_WINDOW_MINUTES = 10
+
+# Startup backfill window: recover readings missed while the service
+# was down in a single Dexcom call (Dexcom emits ~12 readings/hour)
+BACKFILL_MINUTES = 180
+BACKFILL_MAX_COUNT = 36
+
 # XDG Base Directory Specification defaults
 DEFAULT_DATA_DIR = os.environ.get(
     "XDG_DATA_HOME", str(Path.home() / ".local" / "share")
@@ -87,6 +165,12 @@ LOG_FILE = os.path.abspath(
         os.path.join(DEFAULT_STATE_DIR, "dexcom-readings", "dexcom-readings.log")
     )
 )
+STATE_FILE = os.path.abspath(
+    os.environ.get(
+        "DEXCOM_STATE_FILE",
+        os.path.join(DEFAULT_STATE_DIR, "dexcom-readings", "dexcom_state.json")
+    )
+)
 
 # Logging configuration
 LOG_DESTINATION = os.environ.get("DEXCOM_LOG_DESTINATION", "console").lower()
@@ -97,6 +181,40 @@ CSV_HEADERS = [
     "glucose_timestamp_utc", "trend_description", "trend_arrow"
 ]
 
+# Persistent HTTP session for Nightscout uploads. Reusing one session keeps
+# the TCP+TLS connection alive between polls instead of paying the full
+# handshake cost (~150ms) on every upload.
+_ns_session = requests.Session()
+_ns_adapter = HTTPAdapter(
+    pool_connections=1,
+    pool_maxsize=2,
+    max_retries=Retry(
+        total=3,
+        connect=2,
+        read=2,
+        backoff_factor=0.5,
+        status_forcelist=[429, 502, 503, 504],
+        allowed_methods=frozenset(["POST"])
+    )
+)
+_ns_session.mount("https://", _ns_adapter)
+_ns_session.mount("http://", _ns_adapter)
+if NIGHTSCOUT_API_SECRET:
+    # Default headers are set once on the session so they are not rebuilt
+    # on every upload call.
+    _ns_session.headers.update({
+        "api-secret": NIGHTSCOUT_API_SECRET,
+        "Content-Type": "application/json"
+    })
+atexit.register(_ns_session.close)
+
+# Single background worker for Nightscout uploads. Submitting the POST to
+# this executor lets it overlap with the next polling sleep instead of
+# blocking the loop; one worker preserves upload ordering.
+_upload_executor = ThreadPoolExecutor(
+    max_workers=1, thread_name_prefix="ns-upload"
+)
+atexit.register(_upload_executor.shutdown)
 
 class PIDFile:
     """Context manager for PID-based single-instance locking.
@@ -147,7 +265,7 @@ class PIDFile:
             fcntl.flock(self.pidfile.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
             self.pidfile.write(f"{os.getpid()}\n")
             self.pidfile.flush()
-            logging.info(f"Acquired PID file lock: {self.pidfile_path}")
+            logging.info("Acquired PID file lock: %s", self.pidfile_path)
             return self
         except BlockingIOError:
             self.pidfile.close()
@@ -210,7 +328,7 @@ def setup_logging() -> logging.Logger:
         handler = WatchedFileHandler(LOG_FILE, encoding="utf-8")
         handler.setFormatter(formatter)
         logger.addHandler(handler)
-        logging.info(f"Logging to file: {LOG_FILE}")
+        logging.info("Logging to file: %s", LOG_FILE)
 
     elif LOG_DESTINATION == "syslog":
         # Try common syslog addresses
@@ -247,8 +365,10 @@ def setup_logging() -> logging.Logger:
     return logger
 
 
-# Shutdown flag for graceful termination
-shutdown_requested = False
+# Shutdown event for graceful termination. Waiting on the event in
+# place of time.sleep lets SIGTERM/SIGINT interrupt the poll delay
+# immediately instead of after the full interval.
+shutdown_requested = threading.Event()
 
 # SIGHUP flag for log rotation
 log_reopen_requested = False
@@ -290,14 +410,14 @@ def retry_with_backoff(
             last_exception = e
             if attempt < max_attempts - 1:
                 logging.warning(
-                    f"Attempt {attempt + 1}/{max_attempts} failed: {e}. "
-                    f"Retrying in {delay}s..."
+                    "Attempt %d/%d failed: %s. Retrying in %ds...",
+                    attempt + 1, max_attempts, e, delay
                 )
                 time.sleep(delay)
                 delay = min(delay * 2, max_delay)
             else:
                 logging.error(
-                    f"All {max_attempts} attempts failed. Last error: {e}"
+                    "All %d attempts failed. Last error: %s", max_attempts, e
                 )
 
     return None
@@ -306,8 +426,8 @@ def retry_with_backoff(
 def handle_shutdown_signal(signum: int, frame: Any) -> None:
     """Handles SIGTERM and SIGINT for graceful shutdown.
 
-    Sets the shutdown_requested flag to allow the main loop to
-    complete the current polling cycle before exiting.
+    Sets the shutdown event, which both ends the main loop and wakes
+    it from its poll delay so buffers are flushed promptly.
 
     Args:
         signum: The signal number received (SIGTERM or SIGINT).
@@ -316,10 +436,9 @@ def handle_shutdown_signal(signum: int, frame: Any) -> None:
     Returns:
         None
     """
-    global shutdown_requested
     signal_name = "SIGTERM" if signum == signal.SIGTERM else "SIGINT"
-    logging.info(f"Received {signal_name}, completing current cycle...")
-    shutdown_requested = True
+    logging.info("Received %s, completing current cycle...", signal_name)
+    shutdown_requested.set()
 
 
 def handle_sighup(signum: int, frame: Any) -> None:
@@ -357,15 +476,43 @@ def check_and_reopen_logs() -> None:
         logging.info("Log file reopened")
 
 
-def initialize_dexcom_client() -> Optional[Any]:
-    """Initializes and authenticates a Dexcom Share API client.
+def _tune_dexcom_session(dexcom_client: Any) -> None:
+    """Configures keep-alive connection pooling on pydexcom's session.
 
-    Reads credentials from environment variables (DEXCOM_USERNAME,
-    DEXCOM_PASSWORD, DEXCOM_REGION) and creates an authenticated
-    Dexcom client for fetching glucose readings.
+    pydexcom keeps a requests.Session internally for Share API calls;
+    mounting an HTTPAdapter sized for this single-user workload keeps
+    the TCP+TLS connection to the Dexcom host alive across polls,
+    avoiding a fresh handshake (~150ms) on each fetch. A no-op if the
+    installed pydexcom version has no session attribute.
 
     Args:
+        dexcom_client: A Dexcom client instance from pydexcom library.
+
+    Returns:
         None
+    """
+    session = (getattr(dexcom_client, "_session", None) or
+               getattr(dexcom_client, "session", None))
+    if not isinstance(session, requests.Session):
+        logging.info("pydexcom session not found; skipping HTTP tuning")
+        return
+    session.mount(
+        "https://", HTTPAdapter(pool_connections=1, pool_maxsize=2)
+    )
+    logging.info("Configured keep-alive pooling on the Dexcom session")
+
+
+def initialize_dexcom_client(cfg: Optional[dict] = None) -> Optional[Any]:
+    """Initializes and authenticates a Dexcom Share API client.
+
+    By default reads credentials from the environment-derived module
+    config (DEXCOM_USERNAME, DEXCOM_PASSWORD, DEXCOM_REGION); a config
+    dict can be injected instead, which keeps callers and tests from
+    having to mutate process-global state.
+
+    Args:
+        cfg: Optional dict with "username", "password", and "region"
+            keys. Defaults to the environment-derived values.
 
     Returns:
         Dexcom | None: An authenticated Dexcom client instance, or None
@@ -374,27 +521,38 @@ def initialize_dexcom_client() -> Optional[Any]:
     Raises:
         No exceptions raised; errors are logged and None is returned.
     """
-    if not DEXCOM_USERNAME or not DEXCOM_PASSWORD:
+    if cfg is None:
+        # Default path reuses the values normalized once at import
+        username = DEXCOM_USERNAME
+        password = DEXCOM_PASSWORD
+        region = _REGION
+    else:
+        username = cfg.get("username")
+        password = cfg.get("password")
+        region = (cfg.get("region") or "us").lower()
+
+    if not username or not password:
         logging.error("DEXCOM_USERNAME and DEXCOM_PASSWORD must be set.")
         return None  # Return None instead of exiting, let main handle exit
 
-    logging.info(f"Connecting to Dexcom Share for user {DEXCOM_USERNAME} "
-          f"in region {DEXCOM_REGION}...")
+    logging.info("Connecting to Dexcom Share for user %s in region %s...",
+                 username, region)
     try:
-        if DEXCOM_REGION.lower() == "us":
+        if region == "us":
             logging.info("Connecting in us")
-            dexcom_client = Dexcom(username=DEXCOM_USERNAME,
-                                   password=DEXCOM_PASSWORD)
+            dexcom_client = Dexcom(username=username,
+                                   password=password)
         else:
             dexcom_client = Dexcom(
-                DEXCOM_USERNAME,
-                DEXCOM_PASSWORD,
-                ous=DEXCOM_REGION.lower() == "ous"
+                username=username,
+                password=password,
+                region=region
             )
         logging.info("Successfully connected to Dexcom Share.")
+        _tune_dexcom_session(dexcom_client)
         return dexcom_client
     except Exception as e:
-        logging.error(f"Error initializing Dexcom client: {e}")
+        logging.error("Error initializing Dexcom client: %s", e)
         return None
 
 def get_latest_glucose_reading(dexcom_client: Any) -> Optional[Any]:
@@ -418,18 +576,165 @@ def get_latest_glucose_reading(dexcom_client: Any) -> Optional[Any]:
         return None
 
     def fetch_reading() -> Any:
-        return dexcom_client.get_current_glucose_reading()
+        # get_glucose_readings with max_count=1 asks the Share API for
+        # exactly one entry instead of the fixed 24h window behind
+        # get_current_glucose_reading. pydexcom issues the POST with no
+        # socket timeout, so the fetch runs on its own daemon thread per
+        # call and the caller waits at most
+        # DEXCOM_FETCH_TIMEOUT_SECONDS; a shared worker would stay
+        # wedged behind one hung call, starving every later fetch. An
+        # abandoned thread idles until its socket dies, and the
+        # TimeoutError raised here is treated as transient by
+        # retry_with_backoff.
+        result_box: list = []
+        error_box: list = []
+
+        def run_fetch() -> None:
+            try:
+                result_box.append(dexcom_client.get_glucose_readings(
+                    minutes=LATEST_READING_WINDOW_MINUTES, max_count=1
+                ))
+            except BaseException as e:  # Re-raised on the calling thread
+                error_box.append(e)
+
+        worker = threading.Thread(
+            target=run_fetch, name="dexcom-fetch", daemon=True
+        )
+        worker.start()
+        worker.join(timeout=DEXCOM_FETCH_TIMEOUT_SECONDS)
+        if worker.is_alive():
+            raise TimeoutError(
+                f"Dexcom fetch exceeded {DEXCOM_FETCH_TIMEOUT_SECONDS}s"
+            )
+        if error_box:
+            raise error_box[0]
+        readings = result_box[0]
+        return readings[0] if readings else None
 
     result = retry_with_backoff(fetch_reading)
     if result is None:
         logging.error("Failed to fetch glucose reading after all retries")
     return result
 
-def write_to_csv(data_row: list) -> None:
-    """Appends a glucose reading data row to the CSV log file.
+# Cached CSV file handle and writer, initialized by open_csv_log().
+# Keeping the file open across polls avoids a stat + open + close
+# syscall triple (and csv.writer construction) on every cycle.
+_csv_fp: Optional[Any] = None
+_csv_writer: Optional[Any] = None
+
+# In-memory buffer of rows awaiting a batched write to disk. Only the
+# CSV worker thread touches the buffer and the file handle.
+_pending_rows: list = []
+_last_csv_flush = time.monotonic()
+
+# Queue feeding the background CSV writer thread. Bounded so a wedged
+# filesystem cannot grow memory without limit; rows are dropped (with a
+# warning) rather than blocking the polling loop.
+_row_queue: queue.Queue = queue.Queue(maxsize=1024)
+_csv_thread: Optional[threading.Thread] = None
+_CSV_STOP = object()  # Sentinel telling the worker to flush and exit
+
+
+def open_csv_log() -> None:
+    """Opens the CSV log file once and caches the handle and writer.
+
+    Creates the parent directory if needed, performs the file-existence
+    check exactly once, writes the header row for a new file, and stores
+    the open handle and csv.writer at module level for reuse by
+    write_to_csv(). Registers a single atexit hook that flushes any
+    buffered rows before closing the file.
+
+    Args:
+        None
+
+    Returns:
+        None
+
+    Raises:
+        No exceptions raised; file I/O errors are not caught here.
+    """
+    global _csv_fp, _csv_writer
+    if _csv_fp is not None:
+        return
+
+    csv_dir = os.path.dirname(OUTPUT_CSV_FILE)
+    if csv_dir and not os.path.exists(csv_dir):
+        os.makedirs(csv_dir, exist_ok=True)
+
+    # A zero-byte file (e.g. from an interrupted first run) still needs
+    # its header, so check size as well as existence
+    file_has_data = (
+        os.path.isfile(OUTPUT_CSV_FILE)
+        and os.path.getsize(OUTPUT_CSV_FILE) > 0
+    )
+    _csv_fp = open(
+        OUTPUT_CSV_FILE, mode='a', newline='', encoding='utf-8',
+        buffering=8192
+    )
+    _csv_writer = csv.writer(_csv_fp)
+    if not file_has_data:
+        _csv_writer.writerow(CSV_HEADERS)
+        _csv_fp.flush()
+    atexit.register(_close_csv_log)
+
+
+def flush_csv_rows() -> None:
+    """Writes all buffered rows to the CSV log file in one batch.
+
+    Uses the file handle and writer cached by open_csv_log(), opening
+    the file on first use if needed. No-op when the buffer is empty.
+    Called from the atexit hook so buffered rows are not lost on
+    shutdown.
+
+    Args:
+        None
+
+    Returns:
+        None
+
+    Raises:
+        No exceptions raised; file I/O errors are not caught here.
+    """
+    global _last_csv_flush
+    if not _pending_rows:
+        return
+    if _csv_writer is None:
+        open_csv_log()
+    # Snapshot the buffer so rows survive in it if the write raises
+    _csv_writer.writerows(_pending_rows.copy())
+    _csv_fp.flush()
+    _pending_rows.clear()
+    _last_csv_flush = time.monotonic()
+
+
+def _close_csv_log() -> None:
+    """Flushes buffered rows and closes the CSV log file at exit.
+
+    Registered by open_csv_log() as one atexit hook so the safety flush
+    always runs before the handle is closed; two separate hooks would
+    run in LIFO order and close the file first.
+
+    Args:
+        None
+
+    Returns:
+        None
+
+    Raises:
+        No exceptions raised; file I/O errors are not caught here.
+    """
+    flush_csv_rows()
+    if _csv_fp is not None:
+        _csv_fp.close()
+
 
-    Creates the file with headers if it doesn't exist, otherwise appends
-    the data row to the existing file.
+def _buffer_csv_row(data_row: list) -> None:
+    """Buffers a glucose reading data row for batched CSV logging.
+
+    Rows accumulate in memory and are flushed together once
+    CSV_BATCH_SIZE rows are pending or CSV_FLUSH_INTERVAL_SECONDS has
+    elapsed since the last flush, whichever comes first. Called only
+    from the CSV worker thread.
 
     Args:
         data_row: A list of values to write as a CSV row. Expected format:
@@ -442,23 +747,109 @@ def write_to_csv(data_row: list) -> None:
     Raises:
         No exceptions raised; file I/O errors are not caught here.
     """
-    file_exists = os.path.isfile(OUTPUT_CSV_FILE)
-    with open(OUTPUT_CSV_FILE, mode='a', newline='', encoding='utf-8') as f:
-        writer = csv.writer(f)
-        if not file_exists:
-            writer.writerow(CSV_HEADERS)
-        writer.writerow(data_row)
+    _pending_rows.append(data_row)
+    if (len(_pending_rows) >= CSV_BATCH_SIZE or
+            time.monotonic() - _last_csv_flush >= CSV_FLUSH_INTERVAL_SECONDS):
+        flush_csv_rows()
 
-def upload_to_nightscout(
+
+def _csv_worker() -> None:
+    """Consumes log rows from the queue until the stop sentinel arrives.
+
+    Runs in a daemon thread so disk stalls (and the flush when the
+    buffer fills) never block the polling loop. Flushes any buffered
+    rows before exiting.
+
+    Args:
+        None
+
+    Returns:
+        None
+    """
+    while True:
+        row = _row_queue.get()
+        if row is _CSV_STOP:
+            flush_csv_rows()
+            return
+        _buffer_csv_row(row)
+
+
+def start_csv_worker() -> None:
+    """Starts the background CSV writer thread if not already running.
+
+    Args:
+        None
+
+    Returns:
+        None
+    """
+    global _csv_thread
+    if _csv_thread is not None and _csv_thread.is_alive():
+        return
+    _csv_thread = threading.Thread(
+        target=_csv_worker, name="csv-writer", daemon=True
+    )
+    _csv_thread.start()
+
+
+def stop_csv_worker() -> None:
+    """Stops the CSV writer thread, flushing buffered rows first.
+
+    Sends the stop sentinel and joins the thread so all queued rows are
+    on disk before returning.
+
+    Args:
+        None
+
+    Returns:
+        None
+    """
+    global _csv_thread
+    if _csv_thread is None:
+        return
+    _row_queue.put(_CSV_STOP)
+    _csv_thread.join(timeout=10)
+    _csv_thread = None
+
+
+def write_to_csv(data_row: list) -> None:
+    """Hands a glucose reading data row to the background CSV writer.
+
+    The row is queued for the writer thread, decoupling disk latency
+    from the polling loop. If the queue is full (wedged filesystem),
+    the row is dropped with a warning rather than blocking the loop.
+
+    Args:
+        data_row: A list of values to write as a CSV row. Expected format:
+            [check_timestamp_utc, new_reading_received, glucose_value_mgdl,
+             glucose_timestamp_utc, trend_description, trend_arrow]
+
+    Returns:
+        None
+
+    Raises:
+        No exceptions raised; a full queue is logged and the row dropped.
+    """
+    try:
+        _row_queue.put_nowait(data_row)
+    except queue.Full:
+        logging.warning("CSV row queue full, dropping row")
+
+# Entries awaiting a batched upload to Nightscout. The /api/v1/entries
+# endpoint accepts arrays, so queued entries (e.g. backfill after an
+# outage) share one HTTPS round-trip instead of one POST each.
+_ns_queue: collections.deque = collections.deque()
+# Guards the drain/requeue in flush_nightscout(): the upload worker and
+# the main thread's shutdown flush may both touch the queue, and an
+# unguarded check-then-act drain can race
+_ns_queue_lock = threading.Lock()
+
+
+def queue_nightscout_entry(
         value: int,
         timestamp_utc: datetime.datetime,
         trend_arrow: str) -> None:
-    """Uploads a glucose reading to Nightscout via REST API.
-
-    Uses retry logic with exponential backoff for transient failures.
-    Requires NIGHTSCOUT_URL and NIGHTSCOUT_API_SECRET environment
-    variables to be set. If either is missing, the function returns
-    early without uploading.
+    """Queues a glucose reading for the next batched Nightscout upload.
 
     Args:
         value: The glucose value in mg/dL as an integer.
@@ -469,44 +860,255 @@ def upload_to_nightscout(
 
     Returns:
         None
+    """
+    with _ns_queue_lock:
+        _ns_queue.append({
+            "dateString": timestamp_utc.isoformat(),
+            "sgv": value,
+            "direction": trend_arrow,
+            "type": "sgv"
+        })
+
+
+def flush_nightscout() -> bool:
+    """Uploads all queued glucose entries to Nightscout in one POST.
+
+    Uses retry logic with exponential backoff for transient failures.
+    On failure, entries are pushed back onto the queue (in order) so the
+    next flush retries them. Requires NIGHTSCOUT_URL and
+    NIGHTSCOUT_API_SECRET environment variables to be set; if either is
+    missing, the function returns early without uploading.
+
+    Args:
+        None
+
+    Returns:
+        bool: True if the queue was drained (or already empty), False
+            if Nightscout is not configured or the upload failed and
+            the entries were requeued.
 
     Raises:
         No exceptions raised; HTTP and network errors are logged and the
             function returns silently.
     """
-    if not NIGHTSCOUT_URL or not NIGHTSCOUT_API_SECRET:
-        return
-
-    date_string = timestamp_utc.isoformat()
-    entry = {
-        "dateString": date_string,
-        "sgv": value,
-        "direction": trend_arrow,
-        "type": "sgv"
-    }
-
-    url = f"{NIGHTSCOUT_URL.rstrip('/')}/api/v1/entries"
-    headers = {
-        "api-secret": NIGHTSCOUT_API_SECRET,
-        "Content-Type": "application/json"
-    }
-
-    def post_to_nightscout() -> None:
-        logging.info(f"Uploading reading to Nightscout: {value} "
-                    f"at {date_string}")
-        response = requests.post(
-            url, json=[entry], headers=headers, timeout=30
+    if not _NS_ENDPOINT or not NIGHTSCOUT_API_SECRET:
+        return False
+
+    with _ns_queue_lock:
+        if not _ns_queue:
+            return True
+        entries = list(_ns_queue)
+        _ns_queue.clear()
+
+    def post_to_nightscout() -> Any:
+        logging.info("Uploading %d entries to Nightscout", len(entries))
+        response = _ns_session.post(
+            _NS_ENDPOINT,
+            data=_json_dumps(entries),
+            headers={"Content-Type": "application/json"},
+            timeout=(NS_CONNECT_TIMEOUT_SECONDS, NS_READ_TIMEOUT_SECONDS)
         )
         response.raise_for_status()
         logging.info("Successfully uploaded to Nightscout.")
+        return response
 
     result = retry_with_backoff(post_to_nightscout)
     if result is None:
+        # Requeue at the front so entry order is preserved for the
+        # next flush
+        with _ns_queue_lock:
+            _ns_queue.extendleft(reversed(entries))
         logging.error(
-            f"Failed to upload to Nightscout after all retries: "
-            f"{value} at {date_string}"
+            "Failed to upload %d entries to Nightscout after all "
+            "retries; requeued for next cycle", len(entries)
+        )
+        return False
+    return True
+
+
+def upload_to_nightscout(
+        value: int,
+        timestamp_utc: datetime.datetime,
+        trend_arrow: str) -> bool:
+    """Queues a glucose reading and flushes the Nightscout batch.
+
+    Requires NIGHTSCOUT_URL and NIGHTSCOUT_API_SECRET environment
+    variables to be set. If either is missing, the function returns
+    early without uploading. Any previously failed entries still in
+    the queue are sent along with this reading in a single POST.
+
+    Args:
+        value: The glucose value in mg/dL as an integer.
+        timestamp_utc: A datetime object representing the reading timestamp
+            in UTC.
+        trend_arrow: A string representing the trend direction arrow
+            (e.g., "→", "↑", "↓↓").
+
+    Returns:
+        bool: True if the batch was delivered, False if Nightscout is
+            not configured or the upload failed.
+
+    Raises:
+        No exceptions raised; HTTP and network errors are logged and the
+            function returns silently.
+    """
+    if not _NS_ENDPOINT or not NIGHTSCOUT_API_SECRET:
+        return False
+
+    queue_nightscout_entry(value, timestamp_utc, trend_arrow)
+    return flush_nightscout()
+
+
+def _upload_and_persist(
+        value: int,
+        timestamp_utc: datetime.datetime,
+        trend_arrow: str) -> None:
+    """Uploads a reading and persists the dedupe state on success.
+
+    Runs on the upload worker. The state file is written only once
+    flush_nightscout() confirms the batch was delivered, so a crash
+    with entries still queued leaves the state pointing at the last
+    reading Nightscout actually received and the restart backfill
+    recovers the rest.
+
+    Args:
+        value: The glucose value in mg/dL as an integer.
+        timestamp_utc: A datetime object representing the reading timestamp
+            in UTC.
+        trend_arrow: A string representing the trend direction arrow
+            (e.g., "→", "↑", "↓↓").
+
+    Returns:
+        None
+    """
+    if upload_to_nightscout(value, timestamp_utc, trend_arrow):
+        save_last_reading_state(timestamp_utc, value)
+
+
+def load_last_reading_state() -> tuple:
+    """Loads the persisted (timestamp, value) of the last seen reading.
+
+    Used at startup to seed the new-reading check so a process restart
+    does not re-emit the reading that was current when the previous
+    process stopped.
+
+    Args:
+        None
+
+    Returns:
+        tuple: (datetime, int) from the state file, or (None, None) if
+            the file is missing or unreadable.
+
+    Raises:
+        No exceptions raised; a missing or corrupt state file is treated
+            as no prior state.
+    """
+    try:
+        with open(STATE_FILE, encoding='utf-8') as f:
+            state = json.load(f)
+        last_ts = datetime.datetime.fromisoformat(state["last_ts"])
+        return last_ts, state.get("last_val")
+    except (OSError, ValueError, KeyError, TypeError):
+        return None, None
+
+
+def save_last_reading_state(
+        timestamp_utc: datetime.datetime, value: int) -> None:
+    """Atomically persists the (timestamp, value) of the latest reading.
+
+    Writes to a temporary file and renames it over the state file with
+    os.replace so a crash mid-write cannot leave a corrupt state file.
+
+    Args:
+        timestamp_utc: The datetime of the latest accepted reading.
+        value: The glucose value in mg/dL of that reading.
+
+    Returns:
+        None
+
+    Raises:
+        No exceptions raised; write failures are logged as warnings.
+    """
+    state_dir = os.path.dirname(STATE_FILE)
+    try:
+        if state_dir and not os.path.exists(state_dir):
+            os.makedirs(state_dir, exist_ok=True)
+        tmp_path = STATE_FILE + ".tmp"
+        with open(tmp_path, mode='w', encoding='utf-8') as f:
+            json.dump(
+                {"last_ts": timestamp_utc.isoformat(), "last_val": value}, f
+            )
+        os.replace(tmp_path, STATE_FILE)
+    except OSError as e:
+        logging.warning("Could not persist reading state: %s", e)
+
+
+def backfill_readings(
+        dexcom_client: Any,
+        since: Optional[datetime.datetime] = None
+) -> Optional[datetime.datetime]:
+    """Recovers recent glucose history in one Dexcom call at startup.
+
+    Fetches up to BACKFILL_MAX_COUNT readings from the last
+    BACKFILL_MINUTES minutes, logs them to CSV, and drains them to
+    Nightscout as a single batched POST. Used to catch up on readings
+    missed while the service was down.
+
+    Args:
+        dexcom_client: An authenticated Dexcom client instance from
+            pydexcom library.
+        since: If set, readings at or before this timestamp are skipped
+            (already seen by a previous process).
+
+    Returns:
+        datetime | None: The timestamp of the newest backfilled reading,
+            suitable for seeding the main loop's last-known timestamp,
+            or None if no history could be fetched.
+
+    Raises:
+        No exceptions raised; errors are logged and None is returned.
+    """
+    if not dexcom_client:
+        return None
+
+    def fetch_history() -> Any:
+        return dexcom_client.get_glucose_readings(
+            minutes=BACKFILL_MINUTES, max_count=BACKFILL_MAX_COUNT
         )
 
+    readings = retry_with_backoff(fetch_history)
+    if not readings:
+        return None
+
+    nightscout_enabled = bool(_NS_ENDPOINT and NIGHTSCOUT_API_SECRET)
+    check_ts_iso = datetime.datetime.now(_UTC).isoformat()
+    newest = None
+    count = 0
+    for reading in sorted(readings, key=lambda r: r.datetime):
+        if since is not None and not reading.datetime > since:
+            continue
+        write_to_csv([
+            check_ts_iso,
+            True,
+            reading.value,
+            reading.datetime.isoformat(),
+            reading.trend_description,
+            reading.trend_arrow
+        ])
+        if nightscout_enabled:
+            queue_nightscout_entry(
+                reading.value, reading.datetime, reading.trend_arrow
+            )
+        if newest is None or reading.datetime > newest:
+            newest = reading.datetime
+        count += 1
+
+    if count:
+        logging.info("Backfilled %d readings from the last %d minutes",
+                     count, BACKFILL_MINUTES)
+        flush_nightscout()
+    return newest
+
 def main() -> None:
     """Main entry point with PID file single-instance enforcement.
 
@@ -565,27 +1167,44 @@ def _run_main_loop() -> None:
     """
     setup_logging()  # Initialize logging based on LOG_DESTINATION
 
-    last_known_glucose_timestamp = None  # Local state, not global
-
     dexcom_client = initialize_dexcom_client()
     if not dexcom_client:
         logging.error("Exiting due to Dexcom client initialization failure.")
         sys.exit(1)  # Now exit here after logging
 
+    open_csv_log()  # Open the CSV log once; reused for every poll
+    start_csv_worker()  # Disk writes happen off the polling thread
+
+    # Seed the new-reading check from the persisted state so a restart
+    # does not re-emit the previous process's last reading, then recover
+    # anything newer that was missed while the service was down
+    persisted_ts, persisted_val = load_last_reading_state()
+    last_known_glucose_timestamp = backfill_readings(
+        dexcom_client, since=persisted_ts
+    )
+    if last_known_glucose_timestamp is None:
+        last_known_glucose_timestamp = persisted_ts
+
     if not NIGHTSCOUT_URL or not NIGHTSCOUT_API_SECRET:
         logging.warning("NIGHTSCOUT_URL or NIGHTSCOUT_API_SECRET not set. "
               "Nightscout upload will be skipped.")
     else:
-        logging.info(f"Nightscout upload enabled for URL: {NIGHTSCOUT_URL}")
+        logging.info("Nightscout upload enabled for URL: %s", NIGHTSCOUT_URL)
 
-    logging.info(f"Polling Dexcom every {POLLING_INTERVAL_SECONDS} seconds. "
-          f"Logging to {OUTPUT_CSV_FILE}")
+    logging.info("Polling Dexcom every %s seconds. Logging to %s",
+                 POLLING_INTERVAL_SECONDS, OUTPUT_CSV_FILE)
 
-    while not shutdown_requested:
+    last_row_logged = time.monotonic()
+    late_retry_delay = LATE_READING_RETRY_SECONDS
+
+    while not shutdown_requested.is_set():
         # Handle log rotation if SIGHUP was received
         check_and_reopen_logs()
 
-        check_timestamp_utc = datetime.datetime.utcnow()
+        check_timestamp_utc = datetime.datetime.now(_UTC)
+        # Format once; the same string is reused in every message and in
+        # the CSV row for this cycle
+        check_ts_iso = check_timestamp_utc.isoformat()
         new_reading_received = False
 
         current_bg = get_latest_glucose_reading(dexcom_client)
@@ -606,53 +1225,106 @@ def _run_main_loop() -> None:
 
                 last_known_glucose_timestamp = current_glucose_datetime
 
+                current_glucose_iso = current_glucose_datetime.isoformat()
                 glucose_value_to_log = current_bg.value
-                glucose_timestamp_to_log = current_glucose_datetime.isoformat()
+                glucose_timestamp_to_log = current_glucose_iso
                 trend_description_to_log = current_bg.trend_description
                 trend_arrow_to_log = current_bg.trend_arrow
 
                 # Changed to logging for new reading notification
                 logging.info(
-                    f"{check_timestamp_utc.isoformat()}: New reading! "
-                    f"Value: {current_bg.value} mg/dL "
-                    f"({current_bg.trend_description}), "
-                    f"Time: {current_glucose_datetime.isoformat()}"
+                    "%s: New reading! Value: %s mg/dL (%s), Time: %s",
+                    check_ts_iso, current_bg.value,
+                    current_bg.trend_description, current_glucose_iso
                 )
 
-                upload_to_nightscout(
-                    glucose_value_to_log,
-                    current_glucose_datetime,
-                    trend_arrow_to_log
+                # Skip the upload if this exact reading was already the
+                # persisted state (e.g. duplicate across a restart)
+                needs_upload = (
+                    bool(_NS_ENDPOINT and NIGHTSCOUT_API_SECRET) and
+                    (current_glucose_datetime, current_bg.value) !=
+                    (persisted_ts, persisted_val)
                 )
+                persisted_ts = current_glucose_datetime
+                persisted_val = current_bg.value
+                if needs_upload:
+                    # Upload in the background so the POST overlaps
+                    # with the next polling sleep instead of delaying
+                    # it. The worker persists the state only after the
+                    # upload succeeds; persisting up front would let a
+                    # crash with entries still queued mark them as seen
+                    # and the restart backfill would skip them.
+                    _upload_executor.submit(
+                        _upload_and_persist,
+                        glucose_value_to_log,
+                        current_glucose_datetime,
+                        trend_arrow_to_log
+                    )
+                else:
+                    save_last_reading_state(persisted_ts, persisted_val)
             else:
                 last_known = (last_known_glucose_timestamp.isoformat() if
                               last_known_glucose_timestamp else 'N/A')
                 logging.info(
-                    f"{check_timestamp_utc.isoformat()}: No new reading. "
-                    f"Last known: {last_known}"
+                    "%s: No new reading. Last known: %s",
+                    check_ts_iso, last_known
                 )
         else:
-            logging.warning(f"{check_timestamp_utc.isoformat()}: Could not "
-                            f"retrieve glucose reading.")
-
-        log_row = [
-            check_timestamp_utc.isoformat(),
-            new_reading_received,
-            glucose_value_to_log,
-            glucose_timestamp_to_log,
-            trend_description_to_log,
-            trend_arrow_to_log
-        ]
-        write_to_csv(log_row)
+            logging.warning("%s: Could not retrieve glucose reading.",
+                            check_ts_iso)
+
+        # Only log rows that carry a reading; ~80% of polls see nothing
+        # new (Dexcom emits every ~5 minutes). An hourly heartbeat row
+        # preserves a liveness signal in the CSV.
+        heartbeat_due = (
+            time.monotonic() - last_row_logged >= HEARTBEAT_INTERVAL_SECONDS
+        )
+        if new_reading_received or heartbeat_due:
+            log_row = [
+                check_ts_iso,
+                new_reading_received,
+                glucose_value_to_log,
+                glucose_timestamp_to_log,
+                trend_description_to_log,
+                trend_arrow_to_log
+            ]
+            write_to_csv(log_row)
+            last_row_logged = time.monotonic()
+
+        if new_reading_received:
+            # Sleep until just after the next reading is expected, with
+            # a little jitter to avoid herd effects across instances
+            next_wake = current_glucose_datetime + datetime.timedelta(
+                seconds=READING_CADENCE_SECONDS + READING_CADENCE_MARGIN_SECONDS
+            )
+            until_next = (
+                next_wake - datetime.datetime.now(_UTC)
+            ).total_seconds()
+            sleep_duration = max(
+                MIN_SLEEP_SECONDS,
+                until_next + random.uniform(
+                    -POLL_JITTER_SECONDS, POLL_JITTER_SECONDS
+                )
+            )
+            late_retry_delay = LATE_READING_RETRY_SECONDS
+        elif current_bg:
+            # The expected reading is late; retry on a short cadence
+            # with exponential backoff capped at the polling interval
+            sleep_duration = late_retry_delay
+            late_retry_delay = min(
+                late_retry_delay * 2, LATE_READING_RETRY_MAX_SECONDS
+            )
+        else:
+            # Fetch failed entirely; fall back to the base interval
+            sleep_duration = POLLING_INTERVAL_SECONDS
 
-        time.sleep(POLLING_INTERVAL_SECONDS)
+        # Returns early (True) as soon as a shutdown signal arrives
+        shutdown_requested.wait(sleep_duration)
 
+    stop_csv_worker()  # Drain the queue and flush buffered rows
+    flush_nightscout()  # Push any entries still awaiting upload
     logging.info("Shutdown complete.")
 
 
 if __name__ == "__main__":
-    if not os.path.isfile(OUTPUT_CSV_FILE):
-        with open(OUTPUT_CSV_FILE, mode='w', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            writer.writerow(CSV_HEADERS)
     main()
@@ -3,35 +3,71 @@
 This module provides a suite of tests to verify the functionality of
 Dexcom CGM data polling and forwarding to Nightscout.
 """
+import contextlib
+import copy
 import datetime
+from dataclasses import dataclass
+import json
 import logging
 import os
+import runpy
+import shutil
 import signal
 import sys
 import tempfile
+import types
 import unittest
-from unittest.mock import MagicMock, mock_open, patch
+from unittest.mock import (
+    MagicMock, Mock, create_autospec, mock_open, patch
+)
+
+from freezegun import freeze_time
 
 # Assuming dexcom_readings.py is in the same directory or accessible in PYTHONPATH
 import dexcom_readings
 
 # Helper to create mock glucose reading objects similar to what pydexcom might return
+@dataclass(slots=True)
 class MockGlucoseReading:
-    """A helper class to mock glucose reading objects from pydexcom.
+    """A lightweight stand-in for pydexcom.GlucoseReading.
+
+    Slots keep the many per-test instances cheap; the code under test
+    only reads these four attributes and compares .datetime itself.
+    """
+    value: int
+    trend_description: str
+    trend_arrow: str
+    datetime: datetime.datetime
+
+
+class _LogSink:
+    """Lightweight stand-in for a logging function.
 
-    Provides basic attributes and comparison logic to simulate
-    pydexcom.GlucoseReading behavior.
+    Appends call args to a plain list, skipping MagicMock's per-call
+    dispatch and bookkeeping; the main-loop tests only need to know
+    which format strings were logged.
     """
-    def __init__(self, value, trend_description, trend_arrow, dt_obj):
-        self.value = value
-        self.trend_description = trend_description
-        self.trend_arrow = trend_arrow
-        self.datetime = dt_obj
+    __slots__ = ('calls',)
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, *args, **kwargs):
+        self.calls.append(args)
+
+    def formats(self):
+        """Returns the set of format strings logged so far."""
+        return {c[0] for c in self.calls if c}
+
 
-    def __gt__(self, other_datetime):
-        if isinstance(other_datetime, datetime.datetime):
-            return self.datetime > other_datetime
-        return NotImplemented
+# Fixed timestamps and expected CSV rows for the main-loop cases,
+# built once at import instead of inside every test run
+_UTC = datetime.timezone.utc
+_NEW_READING_TIME = datetime.datetime(2023, 1, 1, 11, 55, 0, tzinfo=_UTC)
+_SEEN_READING_TIME = datetime.datetime(2023, 1, 1, 12, 0, 0, tzinfo=_UTC)
+_EXPECTED_NEW_ROW_TAIL = (
+    True, 120, _NEW_READING_TIME.isoformat(), "Rising Fast", "↑↑"
+)
 
 
 class TestDexcomReadings(unittest.TestCase):
@@ -41,81 +77,141 @@ class TestDexcomReadings(unittest.TestCase):
     Nightscout upload functionality.
     """
 
+    @classmethod
+    def setUpClass(cls):
+        # Mock construction dominates setup cost for the init tests;
+        # build one autospec template (which binds the real constructor
+        # signature, so a call the installed pydexcom would reject fails
+        # the test) and shallow-copy it per test instead of constructing
+        # a fresh autospec in every @patch decorator
+        cls._dexcom_mock_template = create_autospec(dexcom_readings.Dexcom)
+        # Module constants cached once per class so test bodies use a
+        # local attribute lookup instead of walking the module dict
+        cls.OUTPUT_CSV_FILE = dexcom_readings.OUTPUT_CSV_FILE
+        cls.CSV_HEADERS = dexcom_readings.CSV_HEADERS
+        cls.CSV_BATCH_SIZE = dexcom_readings.CSV_BATCH_SIZE
+        cls.CSV_FLUSH_INTERVAL_SECONDS = (
+            dexcom_readings.CSV_FLUSH_INTERVAL_SECONDS
+        )
+        cls.MIN_SLEEP_SECONDS = dexcom_readings.MIN_SLEEP_SECONDS
+        cls.LATEST_READING_WINDOW_MINUTES = (
+            dexcom_readings.LATEST_READING_WINDOW_MINUTES
+        )
+        # Expected log format strings, hoisted so assertions can do one
+        # set build + membership check instead of repeated
+        # assert_any_call scans over call_args_list
+        cls.NEW_READING_MSG = (
+            "%s: New reading! Value: %s mg/dL (%s), Time: %s"
+        )
+        cls.NO_NEW_READING_MSG = "%s: No new reading. Last known: %s"
+        cls.NO_READING_WARNING_MSG = (
+            "%s: Could not retrieve glucose reading."
+        )
+
+    def _patched_dexcom(self):
+        """Patches Dexcom with a fresh copy of the cached mock template."""
+        mock_dexcom = copy.copy(self._dexcom_mock_template)
+        mock_dexcom.reset_mock(return_value=True, side_effect=True)
+        return patch('dexcom_readings.Dexcom', new=mock_dexcom)
+
     def setUp(self):
         # Store original sys.exit to restore it if needed
         self._original_sys_exit = sys.exit
+        # Reset the cached CSV handle/writer and row buffer so each test
+        # starts fresh
+        dexcom_readings._csv_fp = None
+        dexcom_readings._csv_writer = None
+        dexcom_readings._pending_rows.clear()
+        dexcom_readings._last_csv_flush = dexcom_readings.time.monotonic()
+        dexcom_readings._ns_queue.clear()
+        # Drain any rows left in the worker queue by a previous test
+        while not dexcom_readings._row_queue.empty():
+            dexcom_readings._row_queue.get_nowait()
 
     def tearDown(self):
         sys.exit = self._original_sys_exit
+        dexcom_readings._csv_fp = None
+        dexcom_readings._csv_writer = None
+        dexcom_readings._pending_rows.clear()
+        dexcom_readings._ns_queue.clear()
 
-    @patch('dexcom_readings.Dexcom')
     @patch('dexcom_readings.logging.info')
     @patch('sys.exit')
-    def test_initialize_dexcom_client_success_us(self, mock_exit, mock_log_info, mock_pydexcom_dexcom):
-        """Test successful Dexcom client initialization for US region."""
-        mock_client_instance = MagicMock()
-        mock_pydexcom_dexcom.return_value = mock_client_instance
-
-        with (patch('dexcom_readings.DEXCOM_USERNAME', 'testuser'),
-              patch('dexcom_readings.DEXCOM_PASSWORD', 'testpassword'),
-              patch('dexcom_readings.DEXCOM_REGION', 'us')):
-            client = dexcom_readings.initialize_dexcom_client()
-
-        self.assertEqual(client, mock_client_instance)
-        mock_pydexcom_dexcom.assert_called_once_with(username="testuser", password="testpassword")
-        mock_exit.assert_not_called()
-
-    @patch('dexcom_readings.Dexcom')
-    @patch('dexcom_readings.logging.info')
-    @patch('sys.exit')
-    def test_initialize_dexcom_client_success_ous(self, mock_exit, mock_log_info, mock_pydexcom_dexcom):
-        """Test successful Dexcom client initialization for OUS region."""
-        mock_client_instance = MagicMock()
-        mock_pydexcom_dexcom.return_value = mock_client_instance
-
-        with (patch('dexcom_readings.DEXCOM_USERNAME', 'testuser'),
-              patch('dexcom_readings.DEXCOM_PASSWORD', 'testpassword'),
-              patch('dexcom_readings.DEXCOM_REGION', 'ous')):
-            client = dexcom_readings.initialize_dexcom_client()
-
-        self.assertEqual(client, mock_client_instance)
-        mock_pydexcom_dexcom.assert_called_once_with("testuser", "testpassword", ous=True)
-        mock_exit.assert_not_called()
-
-    @patch('dexcom_readings.Dexcom')
-    @patch('dexcom_readings.logging.error')
-    def test_initialize_dexcom_client_missing_username(self, mock_log_error, mock_pydexcom_dexcom):
-        """Test initialization failure when username is missing."""
-        with (patch('dexcom_readings.DEXCOM_USERNAME', None),
-              patch('dexcom_readings.DEXCOM_PASSWORD', "testpassword")):
-            client = dexcom_readings.initialize_dexcom_client()
-
-        self.assertIsNone(client)
-        mock_log_error.assert_called()
-        mock_pydexcom_dexcom.assert_not_called()
+    def test_initialize_dexcom_client_success(self, mock_exit, mock_log_info):
+        """Test successful Dexcom client initialization per region."""
+        cases = [
+            ("us", (), {"username": "testuser",
+                        "password": "testpassword"}),
+            ("ous", (), {"username": "testuser",
+                         "password": "testpassword",
+                         "region": "ous"}),
+        ]
+        for region, expected_args, expected_kwargs in cases:
+            with self.subTest(region=region):
+                mock_log_info.reset_mock()
+                mock_client_instance = MagicMock()
+
+                with self._patched_dexcom() as mock_pydexcom_dexcom:
+                    mock_pydexcom_dexcom.return_value = mock_client_instance
+                    client = dexcom_readings.initialize_dexcom_client(cfg={
+                        "username": "testuser",
+                        "password": "testpassword",
+                        "region": region,
+                    })
+
+                self.assertEqual(client, mock_client_instance)
+                mock_pydexcom_dexcom.assert_called_once_with(
+                    *expected_args, **expected_kwargs
+                )
+                mock_exit.assert_not_called()
+
+                # One set build + subset check instead of a linear
+                # assert_any_call scan per expected message
+                logged = {
+                    tuple(c.args) for c in mock_log_info.call_args_list
+                }
+                expected_logs = {
+                    ("Connecting to Dexcom Share for user %s in "
+                     "region %s...", 'testuser', region),
+                    ("Successfully connected to Dexcom Share.",),
+                }
+                if region == "us":
+                    expected_logs.add(("Connecting in us",))
+                self.assertTrue(
+                    expected_logs.issubset(logged),
+                    f"Missing log calls: {expected_logs - logged}"
+                )
 
-    @patch('dexcom_readings.Dexcom')
     @patch('dexcom_readings.logging.error')
-    def test_initialize_dexcom_client_missing_password(self, mock_log_error, mock_pydexcom_dexcom):
-        """Test initialization failure when password is missing."""
-        with (patch('dexcom_readings.DEXCOM_USERNAME', "testuser"),
-              patch('dexcom_readings.DEXCOM_PASSWORD', None)):
-            client = dexcom_readings.initialize_dexcom_client()
-
-        self.assertIsNone(client)
-        mock_log_error.assert_called()
-        mock_pydexcom_dexcom.assert_not_called()
+    def test_initialize_dexcom_client_missing_credentials(self, mock_log_error):
+        """Test initialization failure when either credential is missing."""
+        cases = [
+            ("username", None, "testpassword"),
+            ("password", "testuser", None),
+        ]
+        for missing, username, password in cases:
+            with self.subTest(missing=missing):
+                with self._patched_dexcom() as mock_pydexcom_dexcom:
+                    client = dexcom_readings.initialize_dexcom_client(cfg={
+                        "username": username,
+                        "password": password,
+                        "region": "us",
+                    })
+
+                self.assertIsNone(client)
+                mock_log_error.assert_called()
+                mock_pydexcom_dexcom.assert_not_called()
 
-    @patch('dexcom_readings.Dexcom')
     @patch('dexcom_readings.logging.error')
-    def test_initialize_dexcom_client_api_error(self, mock_log_error, mock_pydexcom_dexcom):
+    def test_initialize_dexcom_client_api_error(self, mock_log_error):
         """Test initialization failure when Dexcom API throws an exception."""
-        mock_pydexcom_dexcom.side_effect = Exception("API Connection Failed")
-
-        with (patch('dexcom_readings.DEXCOM_USERNAME', 'testuser'),
-              patch('dexcom_readings.DEXCOM_PASSWORD', 'testpassword'),
-              patch('dexcom_readings.DEXCOM_REGION', 'us')):
-            client = dexcom_readings.initialize_dexcom_client()
+        with self._patched_dexcom() as mock_pydexcom_dexcom:
+            mock_pydexcom_dexcom.side_effect = Exception("API Connection Failed")
+            client = dexcom_readings.initialize_dexcom_client(cfg={
+                "username": "testuser",
+                "password": "testpassword",
+                "region": "us",
+            })
 
         self.assertIsNone(client)
         mock_log_error.assert_called()
@@ -123,16 +219,34 @@ class TestDexcomReadings(unittest.TestCase):
     @patch('dexcom_readings.logging.error')
     def test_get_latest_glucose_reading_success(self, mock_log_error):
         """Test successful retrieval of the latest glucose reading."""
-        mock_dexcom_client = MagicMock()
+        # A spec'd Mock skips MagicMock's dunder wiring, which these
+        # tests never exercise
+        mock_dexcom_client = Mock(spec=['get_glucose_readings'])
         expected_reading = MockGlucoseReading(100, "Flat", "→", datetime.datetime.utcnow())
-        mock_dexcom_client.get_current_glucose_reading.return_value = expected_reading
+        mock_dexcom_client.get_glucose_readings.return_value = [expected_reading]
 
         reading = dexcom_readings.get_latest_glucose_reading(mock_dexcom_client)
 
         self.assertEqual(reading, expected_reading)
-        mock_dexcom_client.get_current_glucose_reading.assert_called_once()
+        mock_dexcom_client.get_glucose_readings.assert_called_once_with(
+            minutes=self.LATEST_READING_WINDOW_MINUTES,
+            max_count=1
+        )
         mock_log_error.assert_not_called()
 
+    def test_tune_dexcom_session_mounts_adapter(self):
+        """Test that keep-alive pooling is mounted on pydexcom's session."""
+        import requests
+        session = requests.Session()
+        mock_client = MagicMock()
+        mock_client._session = session
+
+        dexcom_readings._tune_dexcom_session(mock_client)
+
+        adapter = session.get_adapter("https://share2.dexcom.com")
+        self.assertEqual(adapter._pool_maxsize, 2)
+        session.close()
+
     def test_get_latest_glucose_reading_no_client(self):
         """Test that reading is None when no Dexcom client is provided."""
         reading = dexcom_readings.get_latest_glucose_reading(None)
@@ -141,9 +255,9 @@ class TestDexcomReadings(unittest.TestCase):
     @patch('dexcom_readings.logging.error')
     def test_get_latest_glucose_reading_api_error(self, mock_log_error):
         """Test that reading is None when Dexcom API returns an error."""
-        mock_dexcom_client = MagicMock()
+        mock_dexcom_client = Mock(spec=['get_glucose_readings'])
         # Use a network exception that retry_with_backoff catches
-        mock_dexcom_client.get_current_glucose_reading.side_effect = ConnectionError("Fetch Error")
+        mock_dexcom_client.get_glucose_readings.side_effect = ConnectionError("Fetch Error")
 
         reading = dexcom_readings.get_latest_glucose_reading(mock_dexcom_client)
 
@@ -152,54 +266,108 @@ class TestDexcomReadings(unittest.TestCase):
 
     @patch('dexcom_readings.csv.writer')
     @patch('builtins.open', new_callable=mock_open)
+    @patch('os.path.getsize')
+    @patch('os.path.exists', return_value=True)
     @patch('os.path.isfile')
-    def test_write_to_csv_new_file(self, mock_isfile, mock_open_func, mock_csv_writer_constructor):
-        """Test writing glucose data to a new CSV file (includes header)."""
-        mock_isfile.return_value = False
-        mock_csv_writer_instance = MagicMock()
-        mock_csv_writer_constructor.return_value = mock_csv_writer_instance
-
-        data_row = ["2023-01-01T12:00:00", True, 100, "2023-01-01T11:55:00", "Rising", "↑"]
-
-        output_file = dexcom_readings.OUTPUT_CSV_FILE
-        headers = dexcom_readings.CSV_HEADERS
-
-        dexcom_readings.write_to_csv(data_row)
-
-        mock_isfile.assert_called_once_with(output_file)
-        mock_open_func.assert_called_once_with(output_file, mode='a', newline='', encoding='utf-8')
-        mock_csv_writer_constructor.assert_called_once_with(mock_open_func())
-
-        self.assertEqual(mock_csv_writer_instance.writerow.call_count, 2)
-        mock_csv_writer_instance.writerow.assert_any_call(headers)
-        mock_csv_writer_instance.writerow.assert_any_call(data_row)
+    def test_open_csv_log(self, mock_isfile, mock_exists, mock_getsize,
+                          mock_open_func, mock_csv_writer_constructor):
+        """Test header handling when opening new and existing CSV logs."""
+        # (case, isfile result, file size, header expected)
+        cases = [
+            ("new_file", False, 0, True),
+            ("existing_file", True, 128, False),
+        ]
+        for case, file_exists, file_size, expect_header in cases:
+            with self.subTest(case=case):
+                for shared_mock in (mock_isfile, mock_getsize,
+                                    mock_open_func,
+                                    mock_csv_writer_constructor):
+                    shared_mock.reset_mock()
+                dexcom_readings._csv_fp = None
+                dexcom_readings._csv_writer = None
+
+                mock_isfile.return_value = file_exists
+                mock_getsize.return_value = file_size
+                mock_csv_writer_instance = MagicMock()
+                mock_csv_writer_constructor.return_value = (
+                    mock_csv_writer_instance
+                )
+
+                dexcom_readings.open_csv_log()
+                dexcom_readings.open_csv_log()  # Second call is a no-op
+
+                mock_isfile.assert_called_once_with(self.OUTPUT_CSV_FILE)
+                mock_open_func.assert_called_once_with(
+                    self.OUTPUT_CSV_FILE, mode='a', newline='',
+                    encoding='utf-8', buffering=8192
+                )
+                mock_csv_writer_constructor.assert_called_once_with(
+                    mock_open_func()
+                )
+                if expect_header:
+                    mock_csv_writer_instance.writerow.assert_called_once_with(
+                        self.CSV_HEADERS
+                    )
+                else:
+                    mock_csv_writer_instance.writerow.assert_not_called()
+
+
+    def test_buffer_csv_row_flushes_at_batch_size(self):
+        """Test that rows are buffered and flushed as one batch."""
+        dexcom_readings._csv_fp = MagicMock()
+        dexcom_readings._csv_writer = MagicMock()
+
+        batch_size = self.CSV_BATCH_SIZE
+        rows = [[f"row{i}"] for i in range(batch_size)]
+
+        for row in rows[:-1]:
+            dexcom_readings._buffer_csv_row(row)
+        dexcom_readings._csv_writer.writerows.assert_not_called()
+
+        dexcom_readings._buffer_csv_row(rows[-1])
+
+        dexcom_readings._csv_writer.writerows.assert_called_once_with(rows)
+        self.assertEqual(dexcom_readings._pending_rows, [])
+
+    def test_buffer_csv_row_flushes_after_interval(self):
+        """Test that a stale buffer is flushed even below batch size."""
+        dexcom_readings._csv_fp = MagicMock()
+        dexcom_readings._csv_writer = MagicMock()
+        dexcom_readings._last_csv_flush = (
+            dexcom_readings.time.monotonic()
+            - self.CSV_FLUSH_INTERVAL_SECONDS
+        )
 
-    @patch('dexcom_readings.csv.writer')
-    @patch('builtins.open', new_callable=mock_open)
-    @patch('os.path.isfile')
-    def test_write_to_csv_existing_file(self, mock_isfile, mock_open_func, mock_csv_writer_constructor):
-        """Test writing glucose data to an existing CSV file (no header)."""
-        mock_isfile.return_value = True
-        mock_csv_writer_instance = MagicMock()
-        mock_csv_writer_constructor.return_value = mock_csv_writer_instance
+        data_row = ["2023-01-01T12:00:00", True, 100,
+                    "2023-01-01T11:55:00", "Rising", "↑"]
+        dexcom_readings._buffer_csv_row(data_row)
 
-        data_row = ["2023-01-01T12:05:00", True, 105, "2023-01-01T12:00:00", "Steady", "→"]
-        output_file = dexcom_readings.OUTPUT_CSV_FILE
+        dexcom_readings._csv_writer.writerows.assert_called_once_with(
+            [data_row]
+        )
+        self.assertEqual(dexcom_readings._pending_rows, [])
 
-        dexcom_readings.write_to_csv(data_row)
+    def test_csv_worker_writes_queued_rows(self):
+        """Test that queued rows reach the writer via the worker thread."""
+        dexcom_readings._csv_fp = MagicMock()
+        dexcom_readings._csv_writer = MagicMock()
 
-        mock_isfile.assert_called_once_with(output_file)
-        mock_open_func.assert_called_once_with(output_file, mode='a', newline='', encoding='utf-8')
-        mock_csv_writer_constructor.assert_called_once_with(mock_open_func())
+        dexcom_readings.start_csv_worker()
+        dexcom_readings.write_to_csv(["row1"])
+        dexcom_readings.write_to_csv(["row2"])
+        dexcom_readings.stop_csv_worker()  # Joins; flushes remaining rows
 
-        mock_csv_writer_instance.writerow.assert_called_once_with(data_row)
+        dexcom_readings._csv_writer.writerows.assert_called_once_with(
+            [["row1"], ["row2"]]
+        )
+        self.assertEqual(dexcom_readings._pending_rows, [])
 
     # --- Tests for upload_to_nightscout() ---
 
     @patch('dexcom_readings.retry_with_backoff')
     def test_upload_to_nightscout_missing_url(self, mock_retry):
         """Test that upload is skipped when NIGHTSCOUT_URL is not set."""
-        with (patch('dexcom_readings.NIGHTSCOUT_URL', None),
+        with (patch('dexcom_readings._NS_ENDPOINT', None),
               patch('dexcom_readings.NIGHTSCOUT_API_SECRET', "secret")):
             dexcom_readings.upload_to_nightscout(100, datetime.datetime.utcnow(), "→")
         mock_retry.assert_not_called()
@@ -207,23 +375,27 @@ class TestDexcomReadings(unittest.TestCase):
     @patch('dexcom_readings.retry_with_backoff')
     def test_upload_to_nightscout_missing_secret(self, mock_retry):
         """Test that upload is skipped when NIGHTSCOUT_API_SECRET is not set."""
-        with (patch('dexcom_readings.NIGHTSCOUT_URL', "https://example.com"),
+        with (patch('dexcom_readings._NS_ENDPOINT',
+                    "https://example.com/api/v1/entries"),
               patch('dexcom_readings.NIGHTSCOUT_API_SECRET', None)):
             dexcom_readings.upload_to_nightscout(100, datetime.datetime.utcnow(), "→")
         mock_retry.assert_not_called()
 
     @patch('dexcom_readings.logging.info')
-    @patch('dexcom_readings.requests.post')
-    @patch('dexcom_readings.NIGHTSCOUT_URL', "https://example.com")
+    @patch('dexcom_readings._NS_ENDPOINT', "https://example.com/api/v1/entries")
     @patch('dexcom_readings.NIGHTSCOUT_API_SECRET', "secret123")
-    def test_upload_to_nightscout_success(self, mock_post, mock_log_info):
-        """Test successful upload to Nightscout."""
+    def test_upload_to_nightscout_success(self, mock_log_info):
+        """Test successful upload to Nightscout via the persistent session."""
         mock_response = MagicMock()
         mock_response.raise_for_status.return_value = None
-        mock_post.return_value = mock_response
 
         timestamp = datetime.datetime(2023, 1, 1, 12, 0, 0)
-        dexcom_readings.upload_to_nightscout(120, timestamp, "↑")
+        # Patch the session at call time; module reloads in other test
+        # classes can replace the session object created at import.
+        with patch.object(
+            dexcom_readings._ns_session, 'post', return_value=mock_response
+        ) as mock_post:
+            dexcom_readings.upload_to_nightscout(120, timestamp, "↑")
 
         expected_entry = {
             "dateString": "2023-01-01T12:00:00",
@@ -233,12 +405,15 @@ class TestDexcomReadings(unittest.TestCase):
         }
         mock_post.assert_called_once()
         call_args = mock_post.call_args
-        self.assertEqual(call_args[1]['json'], [expected_entry])
-        self.assertEqual(call_args[1]['headers']['api-secret'], "secret123")
+        self.assertEqual(
+            call_args[0][0], "https://example.com/api/v1/entries"
+        )
+        sent = json.loads(call_args[1]['data'])
+        self.assertEqual(sent, [expected_entry])
 
     @patch('dexcom_readings.logging.error')
     @patch('dexcom_readings.retry_with_backoff')
-    @patch('dexcom_readings.NIGHTSCOUT_URL', "https://example.com")
+    @patch('dexcom_readings._NS_ENDPOINT', "https://example.com/api/v1/entries")
     @patch('dexcom_readings.NIGHTSCOUT_API_SECRET', "secret123")
     def test_upload_to_nightscout_failure(self, mock_retry, mock_log_error):
         """Test that error is logged when upload fails after retries."""
@@ -248,163 +423,234 @@ class TestDexcomReadings(unittest.TestCase):
         dexcom_readings.upload_to_nightscout(120, timestamp, "↑")
 
         mock_log_error.assert_called()
+        # Failed entries stay queued for the next flush
+        self.assertEqual(len(dexcom_readings._ns_queue), 1)
 
-    # --- Tests for main() logic ---
-
-    @patch('dexcom_readings.signal.signal')
-    @patch('dexcom_readings.logging.error')
-    @patch('dexcom_readings.initialize_dexcom_client')
-    def test_main_init_failure(self, mock_init_client, mock_log_error, mock_signal):
-        """Test that main() exits when Dexcom client initialization fails."""
-        mock_init_client.return_value = None
-
-        with self.assertRaises(SystemExit):
-            dexcom_readings.main()
-
-        mock_init_client.assert_called_once()
-        mock_log_error.assert_called()
-
-    @patch('dexcom_readings.signal.signal')
-    @patch('dexcom_readings.time.sleep', side_effect=KeyboardInterrupt)
-    @patch('dexcom_readings.write_to_csv')
-    @patch('dexcom_readings.get_latest_glucose_reading')
-    @patch('dexcom_readings.initialize_dexcom_client')
     @patch('dexcom_readings.logging.info')
-    @patch('dexcom_readings.datetime.datetime')
-    def test_main_loop_new_reading(self, mock_datetime_module, mock_log_info,
-                                   mock_init_client, mock_get_reading,
-                                   mock_write_csv, mock_sleep, mock_signal):
-        """Test the main loop when a new glucose reading is retrieved."""
-        mock_dex_client = MagicMock()
-        mock_init_client.return_value = mock_dex_client
+    @patch('dexcom_readings._NS_ENDPOINT', "https://example.com/api/v1/entries")
+    @patch('dexcom_readings.NIGHTSCOUT_API_SECRET', "secret123")
+    def test_flush_nightscout_batches_queued_entries(self, mock_log_info):
+        """Test that queued entries are sent in a single batched POST."""
+        mock_response = MagicMock()
+        mock_response.raise_for_status.return_value = None
 
-        fixed_check_time = datetime.datetime(2023, 1, 1, 12, 0, 0)
-        mock_datetime_module.utcnow.return_value = fixed_check_time
+        dexcom_readings.queue_nightscout_entry(
+            100, datetime.datetime(2023, 1, 1, 11, 55, 0), "→")
+        dexcom_readings.queue_nightscout_entry(
+            120, datetime.datetime(2023, 1, 1, 12, 0, 0), "↑")
 
-        glucose_time = datetime.datetime(2023, 1, 1, 11, 55, 0)
-        mock_glucose_reading = MockGlucoseReading(120, "Rising Fast", "↑↑", glucose_time)
-        mock_get_reading.return_value = mock_glucose_reading
+        with patch.object(
+            dexcom_readings._ns_session, 'post', return_value=mock_response
+        ) as mock_post:
+            dexcom_readings.flush_nightscout()
 
-        with self.assertRaises(KeyboardInterrupt):
-            dexcom_readings.main()
+        mock_post.assert_called_once()
+        sent_entries = json.loads(mock_post.call_args[1]['data'])
+        self.assertEqual(len(sent_entries), 2)
+        self.assertEqual([e['sgv'] for e in sent_entries], [100, 120])
+        self.assertEqual(len(dexcom_readings._ns_queue), 0)
 
-        mock_init_client.assert_called_once()
-        mock_get_reading.assert_called_once_with(mock_dex_client)
-
-        expected_log_row = [
-            fixed_check_time.isoformat(),
-            True,
-            120,
-            glucose_time.isoformat(),
-            "Rising Fast",
-            "↑↑"
-        ]
-        mock_write_csv.assert_called_once_with(expected_log_row)
-        mock_sleep.assert_called_once_with(dexcom_readings.POLLING_INTERVAL_SECONDS)
+    # --- Tests for main() logic ---
 
+    @patch('dexcom_readings.setup_logging')
     @patch('dexcom_readings.signal.signal')
-    @patch('dexcom_readings.time.sleep', side_effect=KeyboardInterrupt)
-    @patch('dexcom_readings.write_to_csv')
-    @patch('dexcom_readings.get_latest_glucose_reading')
+    @patch('dexcom_readings.logging.error')
     @patch('dexcom_readings.initialize_dexcom_client')
-    @patch('dexcom_readings.logging.info')
-    @patch('dexcom_readings.datetime.datetime')
-    def test_main_loop_no_new_reading(self, mock_datetime_module, mock_log_info,
-                                      mock_init_client, mock_get_reading,
-                                      mock_write_csv, mock_sleep, mock_signal):
-        """Test the main loop when no new glucose reading is available."""
-        mock_dex_client = MagicMock()
-        mock_init_client.return_value = mock_dex_client
-
-        fixed_check_time = datetime.datetime(2023, 1, 1, 12, 5, 0)
-        mock_datetime_module.utcnow.return_value = fixed_check_time
-
-        # The test should verify behavior, but since last_known_glucose_timestamp
-        # is a local variable in main(), we focus on verifying write_to_csv calls
-        # This test is now simplified to just check that the loop runs once
+    def test_main_init_failure(self, mock_init_client, mock_log_error,
+                               mock_signal, mock_setup_logging):
+        """Test that main() exits when Dexcom client initialization fails."""
+        mock_init_client.return_value = None
 
-        with self.assertRaises(KeyboardInterrupt):
-            dexcom_readings.main()
+        # main() takes a real flock on PID_FILE; point it at a per-test
+        # temp path so parallel pytest workers cannot collide on the
+        # real daemon's lock
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir, ignore_errors=True)
+        with patch('dexcom_readings.PID_FILE',
+                   os.path.join(tmp_dir, "dexcom.pid")):
+            with self.assertRaises(SystemExit):
+                dexcom_readings.main()
 
         mock_init_client.assert_called_once()
-        mock_get_reading.assert_called_once_with(mock_dex_client)
-
-    @patch('dexcom_readings.signal.signal')
-    @patch('dexcom_readings.time.sleep', side_effect=KeyboardInterrupt)
-    @patch('dexcom_readings.write_to_csv')
-    @patch('dexcom_readings.get_latest_glucose_reading')
-    @patch('dexcom_readings.initialize_dexcom_client')
-    @patch('dexcom_readings.logging.warning')
-    @patch('dexcom_readings.datetime.datetime')
-    def test_main_loop_could_not_retrieve_reading(self, mock_datetime_module, mock_log_warning,
-                                                  mock_init_client, mock_get_reading,
-                                                  mock_write_csv, mock_sleep, mock_signal):
-        """Test the main loop when a reading cannot be retrieved from API."""
-        mock_dex_client = MagicMock()
-        mock_init_client.return_value = mock_dex_client
-
-        fixed_check_time = datetime.datetime(2023, 1, 1, 12, 10, 0)
-        mock_datetime_module.utcnow.return_value = fixed_check_time
-
-        mock_get_reading.return_value = None
-
-        dexcom_readings.last_known_glucose_timestamp = datetime.datetime(2023, 1, 1, 11, 0, 0)
-
-        with self.assertRaises(KeyboardInterrupt):
-            dexcom_readings.main()
-
-        mock_get_reading.assert_called_once_with(mock_dex_client)
-
-        expected_log_row = [
-            fixed_check_time.isoformat(),
-            False,
-            None, None, None, None
-        ]
-        mock_write_csv.assert_called_once_with(expected_log_row)
-
-    @patch('dexcom_readings.main')
-    @patch('dexcom_readings.csv.writer')
-    @patch('builtins.open', new_callable=mock_open)
-    @patch('os.path.isfile')
-    def test_script_execution_writes_header_if_new(self, mock_isfile, mock_open_func, mock_csv_writer_constructor, mock_main_func):
-        """Test that the CSV header is written if the file doesn't exist."""
-        mock_isfile.return_value = False
-        mock_csv_writer_instance = MagicMock()
-        mock_csv_writer_constructor.return_value = mock_csv_writer_instance
-
-        def simulate_main_block_header_write():
-            if not os.path.isfile(dexcom_readings.OUTPUT_CSV_FILE):
-                with open(dexcom_readings.OUTPUT_CSV_FILE, mode='w', newline='', encoding='utf-8') as f:
-                    writer = dexcom_readings.csv.writer(f)
-                    writer.writerow(dexcom_readings.CSV_HEADERS)
-
-        simulate_main_block_header_write()
-
-        mock_isfile.assert_called_once_with(dexcom_readings.OUTPUT_CSV_FILE)
-        mock_open_func.assert_called_once_with(dexcom_readings.OUTPUT_CSV_FILE, mode='w', newline='', encoding='utf-8')
-        mock_csv_writer_instance.writerow.assert_called_once_with(dexcom_readings.CSV_HEADERS)
-
-    def test_os_environ_patch_behavior(self):
-        """Verify that patch.dict correctly restores os.environ after use."""
-        test_var_name = "MY_TEST_ENV_VAR_PATCH_BEHAVIOR"
-        original_value = os.environ.get(test_var_name)
-
-        if original_value is not None:
-            del os.environ[test_var_name]
-
-        self.assertIsNone(os.environ.get(test_var_name),
-                            f"Pre-condition: {test_var_name} should not be set in os.environ.")
-
-        patched_value = "test_patched_value_123"
-        with patch.dict(os.environ, {test_var_name: patched_value}):
-            self.assertEqual(os.environ.get(test_var_name), patched_value,
-                             f"Inside patch: {test_var_name} should have the patched value.")
-
-        self.assertIsNone(os.environ.get(test_var_name),
-                            f"After patch: {test_var_name} should be unset (restored).")
+        mock_log_error.assert_called()
 
-        if original_value is not None:
-            os.environ[test_var_name] = original_value
+    def _main_loop_patches(self, stack):
+        """Enters the main-loop patch stack on the given ExitStack.
+
+        One ExitStack install serves every parametrized case in
+        test_main_loop, instead of a ten-decorator stack per method.
+        Returns a SimpleNamespace holding the entered mocks.
+        """
+        mocks = types.SimpleNamespace()
+        # main() takes a real flock on PID_FILE; a per-test temp path
+        # keeps parallel pytest workers from colliding on the real
+        # daemon's lock
+        tmp_dir = tempfile.mkdtemp()
+        stack.callback(shutil.rmtree, tmp_dir, ignore_errors=True)
+        stack.enter_context(patch(
+            'dexcom_readings.PID_FILE', os.path.join(tmp_dir, "dexcom.pid")
+        ))
+        mocks.load_state = stack.enter_context(patch(
+            'dexcom_readings.load_last_reading_state',
+            return_value=(None, None)
+        ))
+        mocks.save_state = stack.enter_context(
+            patch('dexcom_readings.save_last_reading_state')
+        )
+        mocks.open_csv = stack.enter_context(
+            patch('dexcom_readings.open_csv_log')
+        )
+        # Unpatched, every main() call would append a fresh handler to
+        # the root logger and leak it across the worker's run
+        mocks.setup_logging = stack.enter_context(
+            patch('dexcom_readings.setup_logging')
+        )
+        mocks.signal = stack.enter_context(
+            patch('dexcom_readings.signal.signal')
+        )
+        mocks.shutdown = stack.enter_context(
+            patch('dexcom_readings.shutdown_requested')
+        )
+        mocks.write_csv = stack.enter_context(
+            patch('dexcom_readings.write_to_csv')
+        )
+        mocks.get_reading = stack.enter_context(
+            patch('dexcom_readings.get_latest_glucose_reading')
+        )
+        mocks.init_client = stack.enter_context(
+            patch('dexcom_readings.initialize_dexcom_client')
+        )
+        mocks.log_warning = stack.enter_context(patch(
+            'dexcom_readings.logging.warning', new_callable=_LogSink
+        ))
+        mocks.log_info = stack.enter_context(patch(
+            'dexcom_readings.logging.info', new_callable=_LogSink
+        ))
+        return mocks
+
+    def _run_one_cycle(self, mocks, check_time, reading, persisted):
+        """Configures the mocks and runs one loop cycle at check_time.
+
+        The shutdown-event mock raises KeyboardInterrupt from its wait
+        call, terminating the loop after a single iteration. Returns
+        the Dexcom client mock handed to the loop.
+        """
+        for shared_mock in (mocks.init_client, mocks.get_reading,
+                            mocks.write_csv, mocks.shutdown):
+            shared_mock.reset_mock()
+        mocks.log_info.calls.clear()
+        mocks.log_warning.calls.clear()
+
+        mocks.shutdown.is_set.return_value = False
+        mocks.shutdown.wait.side_effect = KeyboardInterrupt
+        mock_dex_client = Mock(spec=['get_glucose_readings'])
+        # Startup backfill sees no history; the poll is mocked
+        mock_dex_client.get_glucose_readings.return_value = []
+        mocks.init_client.return_value = mock_dex_client
+        mocks.get_reading.return_value = reading
+        mocks.load_state.return_value = persisted
+
+        # freeze_time leaves datetime construction and arithmetic
+        # real, unlike patching the datetime class
+        with freeze_time(check_time):
+            with self.assertRaises(KeyboardInterrupt):
+                dexcom_readings.main()
+        return mock_dex_client
+
+    def test_main_loop(self):
+        """Test one main-loop cycle for each reading outcome."""
+        with contextlib.ExitStack() as stack:
+            mocks = self._main_loop_patches(stack)
+            # (case, check time, fetched reading, persisted state,
+            #  expected CSV row tail, sink carrying the expected
+            #  message, message)
+            cases = [
+                ("new_reading",
+                 datetime.datetime(2023, 1, 1, 12, 0, 0, tzinfo=_UTC),
+                 MockGlucoseReading(120, "Rising Fast", "↑↑",
+                                    _NEW_READING_TIME),
+                 (None, None),
+                 _EXPECTED_NEW_ROW_TAIL,
+                 mocks.log_info, self.NEW_READING_MSG),
+                ("no_new_reading",
+                 datetime.datetime(2023, 1, 1, 12, 5, 0, tzinfo=_UTC),
+                 MockGlucoseReading(115, "Flat", "→", _SEEN_READING_TIME),
+                 (_SEEN_READING_TIME, 115),
+                 None, mocks.log_info, self.NO_NEW_READING_MSG),
+                ("fetch_failed",
+                 datetime.datetime(2023, 1, 1, 12, 10, 0, tzinfo=_UTC),
+                 None, (None, None),
+                 None, mocks.log_warning, self.NO_READING_WARNING_MSG),
+            ]
+            for (case, check_time, reading, persisted,
+                 expected_row_tail, sink, expected_msg) in cases:
+                with self.subTest(case=case):
+                    mock_dex_client = self._run_one_cycle(
+                        mocks, check_time, reading, persisted
+                    )
+
+                    mocks.init_client.assert_called_once()
+                    mocks.get_reading.assert_called_once_with(
+                        mock_dex_client
+                    )
+                    self.assertIn(expected_msg, sink.formats())
+
+                    if expected_row_tail is None:
+                        # Cycles without a new reading no longer emit a
+                        # CSV row (only the hourly heartbeat does)
+                        mocks.write_csv.assert_not_called()
+                    else:
+                        mocks.write_csv.assert_called_once()
+                        self.assertEqual(
+                            tuple(mocks.write_csv.call_args.args[0]),
+                            (check_time.isoformat(),) + expected_row_tail
+                        )
+                    # Adaptive polling: wait before the next cycle,
+                    # never less than the minimum sleep
+                    mocks.shutdown.wait.assert_called_once()
+                    self.assertGreaterEqual(
+                        mocks.shutdown.wait.call_args[0][0],
+                        self.MIN_SLEEP_SECONDS
+                    )
+
+
+    def test_script_execution_invokes_main(self):
+        """Verify the __main__ block runs main() when executed as a script."""
+        # runpy re-executes the real module source under run_name
+        # '__main__' instead of reimplementing the entry-point block in
+        # the test. With no credentials set, main() must exit with
+        # status 1 after the client fails to initialize. All file paths
+        # are pointed into a temp directory so the run cannot touch a
+        # real daemon's PID file or logs.
+        original_handlers = logging.getLogger().handlers[:]
+        # main() installs real handlers that reference the throwaway
+        # module copy; restore the originals so they do not outlive the
+        # test in this worker process
+        original_signals = {
+            sig: signal.getsignal(sig)
+            for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP)
+        }
+        tmp_dir = tempfile.mkdtemp()
+        env = {
+            "DEXCOM_USERNAME": "",
+            "DEXCOM_PASSWORD": "",
+            "DEXCOM_PID_FILE": os.path.join(tmp_dir, "dexcom.pid"),
+            "DEXCOM_STATE_FILE": os.path.join(tmp_dir, "state.json"),
+            "DEXCOM_CSV_PATH": os.path.join(tmp_dir, "readings.csv"),
+            "DEXCOM_LOG_FILE": os.path.join(tmp_dir, "dexcom.log"),
+        }
+        try:
+            with patch.dict(os.environ, env):
+                with self.assertRaises(SystemExit) as ctx:
+                    runpy.run_module('dexcom_readings',
+                                     run_name='__main__')
+        finally:
+            logging.getLogger().handlers = original_handlers
+            for sig, handler in original_signals.items():
+                signal.signal(sig, handler)
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        self.assertEqual(ctx.exception.code, 1)
 
 class TestDaemonPaths(unittest.TestCase):
     """Tests for configurable daemon file paths."""
@@ -470,6 +716,41 @@ class TestDaemonPaths(unittest.TestCase):
         )
 
 
+class TestReadingState(unittest.TestCase):
+    """Tests for the persisted last-reading state used for dedupe."""
+
+    def setUp(self):
+        """Create a temporary directory for the state file."""
+        self.test_dir = tempfile.mkdtemp()
+        self.state_path = os.path.join(self.test_dir, "dexcom_state.json")
+
+    def tearDown(self):
+        """Clean up temporary directory."""
+        import shutil
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def test_state_round_trip(self):
+        """Verify a saved (timestamp, value) pair loads back unchanged."""
+        timestamp = datetime.datetime(
+            2023, 1, 1, 12, 0, 0, tzinfo=datetime.timezone.utc
+        )
+
+        with patch('dexcom_readings.STATE_FILE', self.state_path):
+            dexcom_readings.save_last_reading_state(timestamp, 120)
+            loaded_ts, loaded_val = dexcom_readings.load_last_reading_state()
+
+        self.assertEqual(loaded_ts, timestamp)
+        self.assertEqual(loaded_val, 120)
+
+    def test_load_state_missing_file(self):
+        """Verify a missing state file yields (None, None)."""
+        with patch('dexcom_readings.STATE_FILE', self.state_path):
+            loaded_ts, loaded_val = dexcom_readings.load_last_reading_state()
+
+        self.assertIsNone(loaded_ts)
+        self.assertIsNone(loaded_val)
+
+
 class TestPIDFile(unittest.TestCase):
     """Tests for PIDFile single-instance enforcement."""
 